@@ -0,0 +1,105 @@
+"""
+Benchmark de inferencia: modo eager vs modo compilado (KV cache estática + torch.compile).
+
+Carga los pesos una sola vez y mide:
+- costo de compilación + warm-up de buckets (aislado de la carga de pesos),
+- latencia de la primera pregunta en cada modo,
+- tokens/s de punta a punta (prefill incluido; en compilado, también el relleno
+  hasta el bucket) y tokens/s de decode, restando un prefill medido aparte
+  con max_new_tokens=1.
+
+Uso (desde la raíz del repo):
+    PYTHONPATH=$(pwd) FORCE_CPU=1 python scripts/bench_inference.py [--runs 3] [--max-new-tokens 64]
+"""
+import argparse
+import time
+
+import torch
+
+from src.io.loader import load_all_data
+from src.engine.game_state import GameState
+from src.models.llm_stub import SmolLMStub
+from src.models.prompt_builder import PromptBuilder
+
+QUESTIONS = [
+    "¿Dónde estabas anoche durante la función?",
+    "¿Quién tenía motivos para hacerle daño a Ñopin?",
+    "¿Por qué tus manos tienen marcas?",
+]
+
+
+def _state():
+    data = load_all_data()
+    active = next(iter(data["scenarios"]))
+    return GameState(
+        world=data["world"],
+        characters=data["characters"],
+        scenarios=data["scenarios"],
+        relations=data["relations"],
+        active_scenario=active,
+    )
+
+
+def _timed_answer(stub, prompt: str, max_new_tokens: int):
+    t0 = time.perf_counter()
+    output_ids = stub._generate_ids(stub._chat_messages(prompt), max_new_tokens=max_new_tokens)
+    return time.perf_counter() - t0, output_ids.shape[-1]
+
+
+def bench(stub, prompts: list[str], mode: str, runs: int, max_new_tokens: int) -> dict:
+    first_s, _ = _timed_answer(stub, prompts[0], max_new_tokens)
+
+    total_s, total_tokens = 0.0, 0
+    decode_s, decode_tokens = 0.0, 0
+    for i in range(runs):
+        prompt = prompts[i % len(prompts)]
+        prefill_s, _ = _timed_answer(stub, prompt, 1)
+        elapsed, n_tokens = _timed_answer(stub, prompt, max_new_tokens)
+        total_s += elapsed
+        total_tokens += n_tokens
+        # el primer token sale del prefill; el resto es decode
+        decode_s += max(elapsed - prefill_s, 0.0)
+        decode_tokens += n_tokens - 1
+
+    return {
+        "mode": mode,
+        "first_s": first_s,
+        "tok_s": total_tokens / total_s if total_s else 0.0,
+        "decode_tok_s": decode_tokens / decode_s if decode_s else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    state = _state()
+    # Los pesos se cargan una sola vez: ambos modos comparten el mismo modelo y
+    # el costo de compilación se mide aislado, sin mezclarlo con la lectura de disco.
+    stub = SmolLMStub(state, compiled=False)
+    prompter = PromptBuilder(state)
+    character = next(iter(state.characters["characters"]))
+    prompts = [prompter.build_prompt(character, q) for q in QUESTIONS]
+
+    eager = bench(stub, prompts, "eager", args.runs, args.max_new_tokens)
+
+    t0 = time.perf_counter()
+    stub._enable_compiled_mode()
+    compile_s = time.perf_counter() - t0
+    comp = bench(stub, prompts, "compilado", args.runs, args.max_new_tokens)
+
+    print(f"\n{'modo':<10} {'1a pregunta (s)':>16} {'tok/s total':>12} {'tok/s decode':>13}")
+    for r in (eager, comp):
+        print(f"{r['mode']:<10} {r['first_s']:>16.2f} {r['tok_s']:>12.2f} {r['decode_tok_s']:>13.2f}")
+    print(f"\nCosto de compilación + warm-up ({len(stub.buckets)} buckets): {compile_s:.1f} s")
+    if eager["tok_s"]:
+        print(f"Aceleración de punta a punta: x{comp['tok_s'] / eager['tok_s']:.2f}")
+    if eager["decode_tok_s"]:
+        print(f"Aceleración de decode: x{comp['decode_tok_s'] / eager['decode_tok_s']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,7 +6,11 @@ class InterrogationEngine:
         self.state = state
         self.resolver = resolver
         self.model = SmolLMStub(state) 
-        self.prompter = PromptBuilder(state)
+        self.prompter = PromptBuilder(
+            state,
+            resolver=resolver,
+            count_tokens=lambda s: len(self.model.tokenizer(s).input_ids)
+        )
 
     def ask(self, canonical_name: str, user_question: str):
         prompt = self.prompter.build_prompt(
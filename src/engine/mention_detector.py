@@ -0,0 +1,60 @@
+from collections import deque
+from src.utils.text import normalize
+
+class MentionDetector:
+    """
+    Detecta qué personajes menciona una pregunta.
+    Autómata Aho-Corasick construido sobre el índice de alias del NameResolver:
+    una sola pasada por el texto, sin importar cuántos alias haya.
+    """
+
+    def __init__(self, resolver):
+        # estado 0 = raíz; goto[s][c] -> estado, out[s] -> [(largo, canónico)]
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+        for alias, canonical in resolver.index.items():
+            self._add(alias, canonical)
+        self._build_fail_links()
+
+    def _add(self, alias: str, canonical: str):
+        s = 0
+        for c in alias:
+            if c not in self.goto[s]:
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append([])
+                self.goto[s][c] = len(self.goto) - 1
+            s = self.goto[s][c]
+        self.out[s].append((len(alias), canonical))
+
+    def _build_fail_links(self):
+        # los hijos de la raíz ya fallan a la raíz (fail = 0); arrancamos desde ellos
+        queue = deque(self.goto[0].values())
+        while queue:
+            s = queue.popleft()
+            for c, nxt in self.goto[s].items():
+                queue.append(nxt)
+                f = self.fail[s]
+                while f and c not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(c, 0)
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+
+    def detect(self, text: str) -> list[str]:
+        """Nombres canónicos mencionados en `text`, en orden de aparición."""
+        norm = normalize(text)
+        found = []
+        s = 0
+        for i, c in enumerate(norm):
+            while s and c not in self.goto[s]:
+                s = self.fail[s]
+            s = self.goto[s].get(c, 0)
+            for length, canonical in self.out[s]:
+                start = i - length + 1
+                # sólo palabras completas: "jack" no debe matchear dentro de "jackpot"
+                before_ok = start == 0 or not norm[start - 1].isalnum()
+                after_ok = i + 1 == len(norm) or not norm[i + 1].isalnum()
+                if before_ok and after_ok and canonical not in found:
+                    found.append(canonical)
+        return found
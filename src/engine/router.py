@@ -212,6 +212,9 @@ def run_cli():
             answer, clues = engine.ask(current_target, raw)
             rem = state.remaining_questions(current_target)
             print(Style.BRIGHT + answer)
+            if modo_debug:
+                report = engine.prompter.report()
+                print(Fore.RED + f"[DEBUG] Prompt: {report['tokens']} tokens ({report['tokens_saved']} ahorrados por poda)")
 
             # Mostrar solo pistas nuevas
             new_clues = []
@@ -1,42 +1,206 @@
 import os
-from transformers import AutoModelForCausalLM, AutoTokenizer
+import math
+from transformers import AutoModelForCausalLM, AutoTokenizer, StoppingCriteria, StoppingCriteriaList
 import torch
 import textwrap
 
+SYSTEM_MESSAGE = "Responde como si fueras un personaje del Circo de la Medianoche. Sé coherente con tu personalidad y el escenario."
+MAX_NEW_TOKENS = 500
+# Granularidad (en tokens) de los buckets de longitud de prompt en modo compilado.
+PROMPT_BUCKET_SIZE = 128
+WARMUP_QUESTION = "¿Dónde estabas anoche durante la función?"
+# Recompilaciones extra permitidas para prompts que se salen de los buckets precompilados.
+RECOMPILE_HEADROOM = 8
+# Tokens nuevos mínimos garantizados a un prompt que no entra en la cache estática.
+MIN_NEW_TOKENS = 64
+
+
+def _env_flag(name: str) -> bool:
+    return os.getenv(name, "false").lower() in ("1", "true", "yes", "y")
+
+
+class _StopAfter(StoppingCriteria):
+    """Corta la generación tras `n` tokens nuevos sin achicar la cache estática."""
+
+    def __init__(self, prompt_len: int, n: int):
+        self.max_len = prompt_len + n
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return input_ids.shape[-1] >= self.max_len
+
+
 class SmolLMStub:
     """
     Implementación real del stub usando el modelo SmolLM3-3B local de Hugging Face.
     Usa el formato de chat del modelo para mantener el contexto narrativo.
+
+    Modo compilado (opt-in con COMPILED_MODE=1 o compiled=True): pre-reserva una
+    KV cache estática, compila el forward con torch.compile y rellena los prompts
+    a buckets de longitud fija para no recompilar en cada pregunta.
     """
 
-    def __init__(self, state):
+    def __init__(self, state, compiled: bool = None):
         self.state = state
         self.model_name = "HuggingFaceTB/SmolLM3-3B"
         self.device = "cpu" if os.getenv("FORCE_CPU") else ("cuda" if torch.cuda.is_available() else "cpu")
+        self.compiled = _env_flag("COMPILED_MODE") if compiled is None else compiled
 
         print(f"Cargando modelo {self.model_name} en {self.device}... puede tardar un poco.")
         self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
         self.model = AutoModelForCausalLM.from_pretrained(self.model_name).to(self.device)
 
-    def _generate_text(self, messages: list[str]) -> str:
-        """Genera texto usando el formato de chat nativo del modelo."""
+        self.buckets = []
+        self.max_cache_len = None
+        if self.compiled:
+            self._enable_compiled_mode()
+
+    # === modo compilado ===
+
+    def _enable_compiled_mode(self):
+        """Activa KV cache estática + torch.compile y hace el warm-up de los buckets."""
+        self.compiled = True
+        self._configure_tokenizer()
+
+        self.buckets = self._prompt_buckets()
+        # La cache estática se reserva una sola vez para el bucket más grande y nunca
+        # crece (ver _generate_ids): así el grafo de decode no cambia de shapes.
+        self.max_cache_len = self.buckets[-1] + MAX_NEW_TOKENS
+        # un grafo por bucket de prefill + uno para el decode (1, 1), más margen para
+        # prompts que se salgan de los buckets precompilados
+        graphs = len(self.buckets) + 1 + RECOMPILE_HEADROOM
+        config = torch._dynamo.config
+        limit_name = "recompile_limit" if hasattr(config, "recompile_limit") else "cache_size_limit"
+        if getattr(config, limit_name) < graphs:
+            setattr(config, limit_name, graphs)
+
+        self.model.generation_config.cache_implementation = "static"
+        # CUDA graphs sólo aportan en GPU; en CPU usamos el modo por defecto.
+        # dynamic=False: sin esto dynamo pasa a un único grafo de shapes dinámicas
+        # tras el primer cambio prefill -> decode y los buckets no sirven de nada.
+        mode = "reduce-overhead" if self.device == "cuda" else "default"
+        self.model.forward = torch.compile(self.model.forward, mode=mode, fullgraph=True, dynamic=False)
+
+        print(f"Compilando el modelo para buckets de prompt {self.buckets}...")
+        # Del bucket más grande al más chico: la cache estática se reserva una sola
+        # vez con el tamaño máximo y las llamadas siguientes la reutilizan.
+        for bucket in sorted(self.buckets, reverse=True):
+            self._warmup(bucket)
+
+    def _configure_tokenizer(self):
+        # relleno a la izquierda para que los tokens nuevos queden al final;
+        # si hay que recortar, se pierde el principio y no la pregunta
+        self.tokenizer.padding_side = "left"
+        self.tokenizer.truncation_side = "left"
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+
+    def _bucket_for(self, n_tokens: int) -> int:
+        return max(1, math.ceil(n_tokens / PROMPT_BUCKET_SIZE)) * PROMPT_BUCKET_SIZE
+
+    def _prompt_buckets(self) -> list[int]:
+        """Buckets de longitud que producen los prompts reales de PromptBuilder."""
+        from src.models.prompt_builder import PromptBuilder
+
+        prompter = PromptBuilder(self.state, count_tokens=lambda s: len(self.tokenizer(s).input_ids))
+        lengths = []
+        characters = list(self.state.characters["characters"])
+        # PromptBuilder poda según menciones: medimos los extremos (nadie / todos)
+        questions = (WARMUP_QUESTION, f"{WARMUP_QUESTION} ¿Y {', '.join(characters)}?")
+        for character in characters:
+            for question in questions:
+                prompt = prompter.build_prompt(character, question)
+                lengths.append(self._count_tokens(self._chat_messages(prompt)))
+        # prompts de generate_ending (acierto y error del jugador)
+        killer = self.state.get_scenario().get("killer", "")
+        ending_lengths = [
+            self._count_tokens(self._ending_messages(killer, accused))
+            for accused in (killer, "")
+        ]
+        return self._buckets_for_lengths(lengths, ending_lengths)
+
+    def _buckets_for_lengths(self, lengths: list[int], ending_lengths: list[int]) -> list[int]:
+        # Interrogatorios: todos los buckets intermedios (según las menciones el prompt
+        # cae en cualquiera) + uno extra por arriba para preguntas más largas.
+        # Los finales son mucho más cortos: sólo sus propios buckets, sin rellenar el hueco.
+        min_b = self._bucket_for(min(lengths))
+        max_b = self._bucket_for(max(lengths)) + PROMPT_BUCKET_SIZE
+        buckets = set(range(min_b, max_b + PROMPT_BUCKET_SIZE, PROMPT_BUCKET_SIZE))
+        buckets |= {self._bucket_for(n) for n in ending_lengths}
+        return sorted(buckets)
+
+    def _count_tokens(self, messages: list[dict]) -> int:
+        text = self.tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+        return len(self.tokenizer(text).input_ids)
+
+    def _warmup(self, bucket: int):
+        inputs = {
+            "input_ids": torch.full((1, bucket), self.tokenizer.pad_token_id, device=self.device),
+            "attention_mask": torch.ones((1, bucket), dtype=torch.long, device=self.device),
+        }
+        with torch.no_grad():
+            # Misma max_new_tokens que en juego para que la cache tenga el tamaño
+            # definitivo; cortamos tras 2 tokens (prefill + un paso de decode).
+            self.model.generate(
+                **inputs,
+                max_new_tokens=MAX_NEW_TOKENS,
+                do_sample=False,
+                stopping_criteria=StoppingCriteriaList([_StopAfter(bucket, 2)]),
+            )
+
+    # === generación ===
+
+    def _chat_messages(self, prompt: str) -> list[dict]:
+        return [
+            {"role": "system", "content": SYSTEM_MESSAGE},
+            {"role": "user", "content": prompt},
+        ]
+
+    def _tokenize(self, text: str):
+        if not self.compiled:
+            return self.tokenizer([text], return_tensors="pt").to(self.device)
+        n_tokens = len(self.tokenizer(text).input_ids)
+        bucket = self._bucket_for(n_tokens)
+        if bucket > self.buckets[-1]:
+            # fuera de lo precompilado: compila un prefill nuevo, sin pasarse de la cache
+            bucket = min(bucket, self.max_cache_len - MIN_NEW_TOKENS)
+            action = "se recorta" if n_tokens > bucket else "se compila un bucket nuevo"
+            print(f"Aviso: prompt de {n_tokens} tokens fuera de los buckets precompilados "
+                  f"(máx {self.buckets[-1]}); {action}.")
+        return self.tokenizer(
+            [text],
+            return_tensors="pt",
+            padding="max_length",
+            truncation=True,
+            max_length=bucket,
+        ).to(self.device)
+
+    def _generate_ids(self, messages: list[dict], max_new_tokens: int = MAX_NEW_TOKENS):
+        """Ids de los tokens nuevos generados para `messages` (sin el prompt)."""
         text = self.tokenizer.apply_chat_template(
             messages,
             tokenize=False,
             add_generation_prompt=True,
         )
-        inputs = self.tokenizer([text], return_tensors="pt").to(self.device)
+        inputs = self._tokenize(text)
+        if self.compiled:
+            # no pedir más que la cache reservada: si crece, generate la realoca y
+            # todos los grafos compilados cambian de shapes
+            max_new_tokens = min(max_new_tokens, self.max_cache_len - inputs.input_ids.shape[-1])
 
         with torch.no_grad():
             generated_ids = self.model.generate(
                 **inputs,
-                max_new_tokens=500,
+                max_new_tokens=max_new_tokens,
                 temperature=0.9,
                 top_p=0.9,
             )
 
-        # Tomamos solo el nuevo texto generado
-        output_ids = generated_ids[0][len(inputs.input_ids[0]):]
+        # Tomamos solo los tokens nuevos
+        return generated_ids[0][inputs.input_ids.shape[-1]:]
+
+    def _generate_text(self, messages: list[dict], max_new_tokens: int = MAX_NEW_TOKENS) -> str:
+        """Genera texto usando el formato de chat nativo del modelo."""
+        output_ids = self._generate_ids(messages, max_new_tokens)
         return self.tokenizer.decode(output_ids, skip_special_tokens=True).strip()
 
     def generate(self, prompt: str, character: str = None) -> str:
@@ -44,18 +208,16 @@ class SmolLMStub:
         Envía el prompt completo al modelo SmolLM3-3B.
         Usa el formato de conversación para que el modelo adopte el rol del personaje.
         """
-        user_message = {"role": "user", "content": prompt}
-        messages = [
-            {"role": "system", "content": "Responde como si fueras un personaje del Circo de la Medianoche. Sé coherente con tu personalidad y el escenario."},
-            user_message,
-        ]
-        output = self._generate_text(messages)
+        output = self._generate_text(self._chat_messages(prompt))
         return textwrap.shorten(output, width=600, placeholder="…")
 
     def generate_ending(self, actual_killer: str, accused: str) -> str:
         """
         Genera un final narrativo dinámico según el escenario y si el jugador acierta o no.
         """
+        return self._generate_text(self._ending_messages(actual_killer, accused))
+
+    def _ending_messages(self, actual_killer: str, accused: str) -> list[dict]:
         good = (actual_killer == accused)
         scen = self.state.active_scenario
 
@@ -129,6 +291,5 @@ class SmolLMStub:
             f"Cierre base: {ending_text}"
         )
 
-        messages = [{"role": "user", "content": model_prompt}]
-        return self._generate_text(messages)
+        return [{"role": "user", "content": model_prompt}]
 
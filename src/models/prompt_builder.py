@@ -1,8 +1,23 @@
+import os
 from jinja2 import Template
 from pathlib import Path
+from src.engine.name_resolver import NameResolver
+from src.engine.mention_detector import MentionDetector
+from src.utils.text import estimate_tokens
+
+# reglas que sólo aplican si hay algún par de aliados en el prompt
+ALLY_RULES = ("defend_ally_if_accused", "feel_betrayed_if_ally_accuses")
 
 class PromptBuilder:
-    def __init__(self, state):
+    """
+    Arma el prompt del personaje interrogado.
+    Sólo incluye estados emocionales y relaciones del interrogado y de los personajes
+    mencionados en la pregunta; si hay presupuesto de tokens (token_budget o
+    PROMPT_TOKEN_BUDGET) recorta primero lo menos relevante.
+    count_tokens: conteo con el tokenizer del modelo; sin él se usa estimate_tokens.
+    """
+
+    def __init__(self, state, resolver=None, token_budget: int = None, count_tokens=None):
         self.state = state
         base = Path(__file__).resolve().parents[1] / "prompts"
         self.system_tpl = (base / "system_prompt.txt").read_text(encoding="utf-8")
@@ -10,9 +25,86 @@ class PromptBuilder:
         self.scenario_tpl = Template((base / "scenario_prompt.j2").read_text(encoding="utf-8"))
         self.guard_tpl = Template((base / "guardrails_prompt.j2").read_text(encoding="utf-8"))
 
+        # sin resolver, detectamos sólo los nombres canónicos
+        if resolver is None:
+            resolver = NameResolver({name: [] for name in state.characters["characters"]})
+        self.detector = MentionDetector(resolver)
+
+        if token_budget is None:
+            token_budget = self._env_budget()
+        self.token_budget = token_budget
+        self.count_tokens = count_tokens or estimate_tokens
+        self._last = None
+
+    def _env_budget(self):
+        env_budget = os.getenv("PROMPT_TOKEN_BUDGET", "").strip()
+        if not env_budget:
+            return None
+        try:
+            return int(env_budget)
+        except ValueError:
+            print(f"PROMPT_TOKEN_BUDGET='{env_budget}' no es un entero; se usa el prompt sin presupuesto.")
+            return None
+
     def build_prompt(self, character: str, user_question: str) -> str:
+        relations = self.state.relations.get("relations", {})
+        emotional = self.state.get_scenario().get("emotional_state", {})
+        mentioned = [c for c in self.detector.detect(user_question) if c != character]
+        relevant = {character, *mentioned}
+
+        ctx = {
+            "emotional_state": {who: emo for who, emo in emotional.items() if who in relevant},
+            "allies": [p for p in relations.get("allies", []) if relevant & set(p)],
+            "tensions": [p for p in relations.get("tensions", []) if relevant & set(p)],
+        }
+        prompt = self._assemble(character, user_question, ctx)
+
+        # Recorte por presupuesto, de menor a mayor relevancia:
+        # emociones de mencionados -> pares sin el interrogado -> pares con el interrogado
+        droppable = [("emotional_state", who) for who in reversed(mentioned) if who in ctx["emotional_state"]]
+        for touches_character in (False, True):
+            for kind in ("tensions", "allies"):
+                droppable += [(kind, p) for p in reversed(ctx[kind]) if (character in p) == touches_character]
+        while self.token_budget and self.count_tokens(prompt) > self.token_budget and droppable:
+            kind, item = droppable.pop(0)
+            if kind == "emotional_state":
+                del ctx[kind][item]
+            else:
+                ctx[kind].remove(item)
+            prompt = self._assemble(character, user_question, ctx)
+
+        self._last = (character, user_question, prompt, mentioned)
+        return prompt
+
+    def report(self) -> dict:
+        """
+        Métricas del último prompt: menciones, tokens y tokens ahorrados
+        frente al prompt sin podar. Se calcula a pedido para no pagarlo en cada pregunta.
+        """
+        if self._last is None:
+            return {}
+        character, user_question, prompt, mentioned = self._last
+        relations = self.state.relations.get("relations", {})
+        full_ctx = {
+            "emotional_state": self.state.get_scenario().get("emotional_state", {}),
+            "allies": relations.get("allies", []),
+            "tensions": relations.get("tensions", []),
+        }
+        full_tokens = self.count_tokens(self._assemble(character, user_question, full_ctx))
+        tokens = self.count_tokens(prompt)
+        return {
+            "mentioned": mentioned,
+            "tokens": tokens,
+            "tokens_full": full_tokens,
+            "tokens_saved": full_tokens - tokens,
+        }
+
+    def _assemble(self, character: str, user_question: str, ctx: dict) -> str:
         ch_data = self.state.characters["characters"][character]
         scen_data = self.state.get_scenario()
+        rules = self.state.relations.get("relations", {}).get("rules", {})
+        if not ctx["allies"]:
+            rules = {k: v for k, v in rules.items() if k not in ALLY_RULES}
 
         character_block = self.character_tpl.render(
             name=character,
@@ -20,7 +112,10 @@ class PromptBuilder:
         )
         scenario_block = self.scenario_tpl.render(
             scenario=scen_data,
-            relations=self.state.relations
+            emotional_state=ctx["emotional_state"],
+            allies=ctx["allies"],
+            tensions=ctx["tensions"],
+            rules=rules
         )
         guard_block = self.guard_tpl.render()
 
@@ -12,3 +12,7 @@ def normalize(s: str) -> str:
     s = strip_accents(s)
     s = re.sub(r"\s+", " ", s)
     return s
+
+def estimate_tokens(s: str) -> int:
+    # aproximación sin tokenizer: palabras + signos de puntuación
+    return len(re.findall(r"\w+|[^\w\s]", s))
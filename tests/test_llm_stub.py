@@ -0,0 +1,74 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("transformers")
+
+from mystery_game.src.models.llm_stub import SmolLMStub, PROMPT_BUCKET_SIZE, MAX_NEW_TOKENS
+
+class FakeBatch:
+    def __init__(self, ids):
+        self.input_ids = torch.tensor(ids)
+
+    def to(self, device):
+        return self
+
+class FakeTokenizer:
+    """Un token por palabra; rellena/recorta como el tokenizer de HF."""
+    pad_token = None
+    pad_token_id = 0
+    eos_token = "<eos>"
+    padding_side = "right"
+    truncation_side = "right"
+
+    def __call__(self, text, return_tensors=None, padding=False, truncation=False, max_length=None):
+        if isinstance(text, str):
+            return FakeBatch([1] * len(text.split()))
+        rows = []
+        for t in text:
+            ids = list(range(1, len(t.split()) + 1))
+            if truncation and len(ids) > max_length:
+                ids = ids[-max_length:] if self.truncation_side == "left" else ids[:max_length]
+            pad = [self.pad_token_id] * (max_length - len(ids)) if padding == "max_length" else []
+            rows.append(pad + ids if self.padding_side == "left" else ids + pad)
+        return FakeBatch(rows)
+
+def compiled_stub(buckets):
+    stub = SmolLMStub.__new__(SmolLMStub)
+    stub.device = "cpu"
+    stub.compiled = True
+    stub.tokenizer = FakeTokenizer()
+    stub._configure_tokenizer()
+    stub.buckets = buckets
+    stub.max_cache_len = buckets[-1] + MAX_NEW_TOKENS
+    return stub
+
+def test_bucket_rounding():
+    stub = compiled_stub([PROMPT_BUCKET_SIZE])
+    assert stub._bucket_for(0) == PROMPT_BUCKET_SIZE
+    assert stub._bucket_for(1) == PROMPT_BUCKET_SIZE
+    assert stub._bucket_for(PROMPT_BUCKET_SIZE) == PROMPT_BUCKET_SIZE
+    assert stub._bucket_for(PROMPT_BUCKET_SIZE + 1) == 2 * PROMPT_BUCKET_SIZE
+
+def test_buckets_contiguous_plus_one_and_endings():
+    stub = compiled_stub([PROMPT_BUCKET_SIZE])
+    b = PROMPT_BUCKET_SIZE
+    # interrogatorios entre 3b y 5b, finales cortos en el primer bucket
+    buckets = stub._buckets_for_lengths([3 * b - 10, 5 * b - 1], [b - 20, b - 5])
+    assert buckets == [b, 3 * b, 4 * b, 5 * b, 6 * b]
+
+def test_tokenize_left_pads_to_bucket():
+    b = PROMPT_BUCKET_SIZE
+    stub = compiled_stub([b, 2 * b])
+    inputs = stub._tokenize(" ".join(["w"] * (b + 5)))
+    assert inputs.input_ids.shape == (1, 2 * b)
+    assert inputs.input_ids[0, : b - 5].eq(0).all()
+    assert inputs.input_ids[0, -1].item() == b + 5
+
+def test_tokenize_overflow_is_logged_and_fits_cache(capsys):
+    b = PROMPT_BUCKET_SIZE
+    stub = compiled_stub([b])
+    inputs = stub._tokenize(" ".join(["w"] * (b + MAX_NEW_TOKENS)))
+    assert "fuera de los buckets" in capsys.readouterr().out
+    assert inputs.input_ids.shape[-1] < stub.max_cache_len
+    # se recorta por la izquierda: el final del prompt se conserva
+    assert inputs.input_ids[0, -1].item() == b + MAX_NEW_TOKENS
@@ -0,0 +1,19 @@
+from mystery_game.src.engine.name_resolver import NameResolver
+from mystery_game.src.engine.mention_detector import MentionDetector
+
+ALIASES = {
+    "Silvana Funambula": ["silvana", "funambula", "silvi"],
+    "Madame Seraphine": ["madame", "seraphine"],
+    "Jack Domador": ["jack", "domador"],
+    "Ñopin Desfijo": ["ñopin", "nopin", "desfijo"]
+}
+
+def test_detects_aliases_and_accents():
+    d = MentionDetector(NameResolver(ALIASES))
+    found = d.detect("¿Viste a Silvi discutir con el DOMADOR y con Ñopín?")
+    assert found == ["Silvana Funambula", "Jack Domador", "Ñopin Desfijo"]
+
+def test_ignores_partial_words():
+    d = MentionDetector(NameResolver(ALIASES))
+    assert d.detect("¿Ganaste el jackpot anoche?") == []
+    assert d.detect("Madame Seraphine y madame") == ["Madame Seraphine"]
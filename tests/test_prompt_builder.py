@@ -12,7 +12,9 @@ def minimal_state():
                     "traits": ["perfeccionista"],
                     "tics": ["evita miradas"],
                     "base_emotion": "tensa"
-                }
+                },
+                "Jack Domador": {"role": "Domador"},
+                "Mefisto Bombita": {"role": "Payaso"}
             }
         },
         scenarios={
@@ -21,11 +23,19 @@ def minimal_state():
                 "motive": "desesperación",
                 "modus": "golpe",
                 "precrime": {},
-                "emotional_state": {"Silvana Funambula": "culpa"},
+                "emotional_state": {
+                    "Silvana Funambula": "culpa",
+                    "Jack Domador": "irritado",
+                    "Mefisto Bombita": "nervioso"
+                },
                 "clues": ["mancha"]
             }
         },
-        relations={"relations": {"allies": [], "tensions": [], "rules": {}}},
+        relations={"relations": {
+            "allies": [["Jack Domador", "Mefisto Bombita"]],
+            "tensions": [["Silvana Funambula", "Jack Domador"]],
+            "rules": {"defend_ally_if_accused": True, "counterattack_on_false_accusation": True}
+        }},
         active_scenario="S1"
     )
 
@@ -37,3 +47,58 @@ def test_prompt_contains_blocks():
     assert "## CHARACTER CARD" in p
     assert "## GUARDRAILS" in p
     assert "¿Dónde estabas?" in p
+
+def test_prompt_prunes_unmentioned_characters():
+    pb = PromptBuilder(minimal_state())
+    p = pb.build_prompt("Silvana Funambula", "¿Dónde estabas?")
+    assert "Silvana Funambula: culpa" in p
+    assert "Mefisto Bombita" not in p
+    assert "Defender a aliado" not in p
+    assert "Contraatacar" in p
+    assert pb.report()["tokens_saved"] > 0
+
+def test_prompt_includes_mentioned_characters():
+    pb = PromptBuilder(minimal_state())
+    p = pb.build_prompt("Silvana Funambula", "¿Y Jack Domador?")
+    assert "Jack Domador: irritado" in p
+    assert "Mefisto Bombita" in p
+    assert pb.report()["mentioned"] == ["Jack Domador"]
+
+def test_prompt_respects_token_budget():
+    full = PromptBuilder(minimal_state()).build_prompt("Silvana Funambula", "¿Y Jack Domador?")
+    pb = PromptBuilder(minimal_state(), token_budget=1)
+    p = pb.build_prompt("Silvana Funambula", "¿Y Jack Domador?")
+    assert len(p) < len(full)
+    assert "Jack Domador: irritado" not in p
+    assert "Silvana Funambula: culpa" in p
+
+def test_prompt_budget_drops_least_relevant_first():
+    # presupuesto intermedio: cabe el prompt sin la emoción de Jack ni el par Jack/Mefisto
+    question = "¿Y Jack Domador?"
+    pb = PromptBuilder(minimal_state(), count_tokens=len)
+    target = pb._assemble("Silvana Funambula", question, {
+        "emotional_state": {"Silvana Funambula": "culpa"},
+        "allies": [],
+        "tensions": [["Silvana Funambula", "Jack Domador"]],
+    })
+    pb.token_budget = len(target)
+    p = pb.build_prompt("Silvana Funambula", question)
+    assert p == target
+    assert "Jack Domador: irritado" not in p
+    assert "['Jack Domador', 'Mefisto Bombita']" not in p
+    assert "['Silvana Funambula', 'Jack Domador']" in p
+    assert "Defender a aliado" not in p
+    assert "Contraatacar" in p
+    assert pb.report()["tokens"] == len(p)
+
+def test_prompt_omits_empty_emotional_heading():
+    pb = PromptBuilder(minimal_state())
+    state = pb.state
+    del state.scenarios["S1"]["emotional_state"]["Silvana Funambula"]
+    p = pb.build_prompt("Silvana Funambula", "¿Dónde estabas?")
+    assert "Estados emocionales esperados" not in p
+
+def test_invalid_env_budget_falls_back(monkeypatch):
+    monkeypatch.setenv("PROMPT_TOKEN_BUDGET", "mucho")
+    pb = PromptBuilder(minimal_state())
+    assert pb.token_budget is None